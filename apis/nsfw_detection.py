@@ -1,36 +1,47 @@
-"""This NSFW detection uses the NudeNet library."""
+"""This NSFW detection uses GantMan's nsfw_model through library.classifier."""
 
 
+import onnxruntime as ort
 import validators
-from fastnsfw.classifier import Classifier
-from fastnsfw.exceptions import *
+from fastnsfw.exceptions import InternalRequestError, UnknownContentType
 from typing import TYPE_CHECKING
 from flask import Blueprint, request
-from library.schemas import *
+from library import NSFWClassifier
+from library.schemas import NSFW_DETECTION_CLASSIFY
 from fluxhelper.flask import makeResponse
 
 if TYPE_CHECKING:
     from ..app import Server
 
 
-MODEL_PATH = "./apis/models/nsfw_mobilenet2.224x224.h5"
+# ONNX models generated from nsfw_mobilenet2.224x224.h5 with `python -m library.quantization`.
+# The INT8 model is for CPUs, CUDA doesn't have int8 kernels for it so GPUs get the FP32 one.
+MODEL_PATH = "./apis/models/nsfw_mobilenet2.224x224.int8.onnx"
+GPU_MODEL_PATH = "./apis/models/nsfw_mobilenet2.224x224.onnx"
 IMG_SIZE = 224
 
 
 def constructNsfw(server: "Server") -> Blueprint:
     app = Blueprint("nsfw_detection", __name__, url_prefix="/nsfw_detection")
-    classifier = Classifier(
-        model=MODEL_PATH,
+    useGpu = "CUDAExecutionProvider" in ort.get_available_providers()
+    classifier = NSFWClassifier(
+        model=GPU_MODEL_PATH if useGpu else MODEL_PATH,
         logging=server.logging,
         imgSize=(IMG_SIZE, IMG_SIZE),
         frameUniqueness=30,
-        workers=4
+        sampleRate=1000,
+        batchSize=16,
+        cache=server.db.classified_nsfw
     )
 
+    if server.dbClient.type == "mongo":
+        server.db.classified_nsfw.create_index("hash")
+        server.db.classified_nsfw.create_index("perceptualHash", sparse=True)
+
     @app.route("/classify", methods=["GET"])
     @server.limiter.limit(4, key="ratelimitKey")
     @server.validator.validate(NSFW_DETECTION_CLASSIFY)
-    async def classify():
+    def classify():
 
         """
         Classifies an image or video url whether it is NSFW or not.
@@ -1,4 +1,6 @@
+import atexit
 import datetime
+import functools
 import sys
 import threading
 import time
@@ -10,7 +12,7 @@ from flask import Flask
 from fluxhelper import Database, Logger, joinPath, loadJson
 
 from apis import constructNsfw
-from library import APISecurity, RateLimiter, RouteValidator, utilities
+from library import APISecurity, ORJSONFlask, RateLimiter, RouteValidator, utilities
 
 
 class Monitor:
@@ -28,9 +30,20 @@ class Monitor:
 
         self.monitorThread = None
         self.monitorStopped = False
+        self.monitorInterval = 10
+        # Samples are inserted in batches, 60 samples every 10 seconds makes it one insert per 10 minutes.
+        self.monitorBatchSize = 60
+        self.monitorSamples = []
+        self.monitorLock = threading.Lock()
 
     def monitor(self) -> None:
         """Start the monitor."""
+
+        # The monitor thread is a daemon and gets killed on exit, write out whatever it buffered before that happens.
+        atexit.register(self.flushMonitoring)
+
+        # The first non blocking call always returns 0.0, it only sets the starting point for the next one.
+        psutil.cpu_percent(interval=None)
         self.monitorThread = threading.Thread(
             target=self.monitor_, daemon=True)
         self.monitorThread.start()
@@ -39,9 +52,19 @@ class Monitor:
         """Stop the monitor."""
         self.monitorStopped = True
 
+    def flushMonitoring(self) -> None:
+        with self.monitorLock:
+            samples, self.monitorSamples = self.monitorSamples, []
+
+        if samples:
+            self.db.monitoring.insert_many(samples)
+
     def monitor_(self) -> None:
         while not self.monitorStopped:
-            cpu = psutil.cpu_percent()
+            # Sleeping first gives cpu_percent a full interval to measure since the call in monitor().
+            time.sleep(self.monitorInterval)
+
+            cpu = psutil.cpu_percent(interval=None)
             virtual_memory = psutil.virtual_memory()
 
             data = {
@@ -62,20 +85,26 @@ class Monitor:
             self.logging.debug(
                 f"Memory Used: {data['memory']['used']} ({data['memory']['percent']}%) | CPU: {data['cpu']['percent']}%")
 
-            self.db.monitoring.insert_one(data)
-            time.sleep(10)
+            with self.monitorLock:
+                self.monitorSamples.append(data)
+                full = len(self.monitorSamples) >= self.monitorBatchSize
+
+            if full:
+                self.flushMonitoring()
+
+        self.flushMonitoring()
 
 
 class Server(Monitor):
     def __init__(self, port: int = None, doMonitor: bool = False, **kwargs) -> None:
         self.kwargs = kwargs
         self.logging = Logger(debug=True)
-        self.app = Flask(__name__)
+        self.app = ORJSONFlask(__name__)
         self.limiter = RateLimiter()
         self.validator = RouteValidator()
+        self.ignoreCloud = kwargs.get("ignoreCloud", False)
         self.port = port if port else self.config["server"]["port"]
         self.doMonitor = doMonitor
-        self.ignoreCloud = kwargs.get("ignoreCloud", False)
 
         # Initialize database
         self.dbClient = Database(
@@ -112,8 +141,10 @@ class Server(Monitor):
             self.app.run(host=host, port=self.port,
                          use_reloader=False, debug=True)
 
-    @property
+    @functools.cached_property
     def config(self) -> dict:
+        """config.json with the environment specific overwrites applied, loaded once on first access."""
+
         config = loadJson(joinPath("./config.json"))[0]
 
         if utilities.inCloud() and not self.ignoreCloud:
@@ -1 +1,3 @@
-from .security import APISecurity, RateLimiter, RouteValidator
\ No newline at end of file
+from .security import APISecurity, RateLimiter, RouteValidator
+from .classifier import NSFWClassifier
+from .serialization import ORJSONFlask
\ No newline at end of file
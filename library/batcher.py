@@ -0,0 +1,75 @@
+"""Coalesce inference calls coming from concurrent requests into a single batched model run."""
+
+import threading
+import time
+from concurrent.futures import Future
+from queue import Empty, Queue
+from typing import Callable, List, Tuple
+
+import numpy as np
+
+
+class BatchScheduler:
+    """
+    Runs function on batches built out of the arrays submitted by different threads. A batch is run once it holds
+    maxBatch rows or once maxWaitMs milliseconds have passed since its first array arrived, whichever comes first.
+
+    Parameters
+    ----------
+    `function` : Callable[[np.ndarray], np.ndarray]
+        Function that takes a stacked batch and returns one output row per input row.
+    `maxBatch` : int
+        Amount of rows to collect before running a batch early.
+    `maxWaitMs` : float
+        Maximum time the first array of a batch waits for others to join it.
+    """
+
+    def __init__(self, function: Callable[[np.ndarray], np.ndarray], maxBatch: int = 16, maxWaitMs: float = 8) -> None:
+        self.function = function
+        self.maxBatch = maxBatch
+        self.maxWait = maxWaitMs / 1000
+
+        self.queue = Queue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, batch: np.ndarray) -> np.ndarray:
+        """Queue batch and block until its outputs are ready."""
+
+        future = Future()
+        self.queue.put((batch, future))
+        return future.result()
+
+    def run(self) -> None:
+        while True:
+            pending = [self.queue.get()]
+            size = len(pending[0][0])
+            deadline = time.monotonic() + self.maxWait
+
+            while size < self.maxBatch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except Empty:
+                    break
+
+                pending.append(item)
+                size += len(item[0])
+
+            self.runPending(pending)
+
+    def runPending(self, pending: List[Tuple[np.ndarray, Future]]) -> None:
+        try:
+            outputs = self.function(np.concatenate([batch for batch, _ in pending]))
+        except Exception as e:
+            for _, future in pending:
+                future.set_exception(e)
+            return
+
+        offset = 0
+        for batch, future in pending:
+            future.set_result(outputs[offset:offset + len(batch)])
+            offset += len(batch)
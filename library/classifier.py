@@ -0,0 +1,467 @@
+"""
+NSFW classifier replacing fastnsfw's own Classifier. Unlike fastnsfw's, frames are preprocessed
+into a single preallocated array and fed into the model in fixed size batches. Video frames are sampled by
+seeking to keyframes with PyAV, falling back to a single ffmpeg process for variable frame rate videos, and
+classified as they come in.
+"""
+
+import datetime
+import errno
+import os
+import tempfile
+import time
+from io import BytesIO
+from types import MappingProxyType
+from typing import BinaryIO, Iterable, List, Optional, Tuple
+
+import av
+import cv2
+import imagehash
+import numpy as np
+import onnxruntime as ort
+import requests
+import xxhash
+from fastnsfw.exceptions import InternalRequestError, UnknownContentType
+from fluxhelper import Logger
+from PIL import Image, ImageSequence
+
+from library.batcher import BatchScheduler
+from library.frame_pipe import FFmpegError, extractFrames
+from library.utilities import BoundedCache
+from library.video_sampler import VariableFrameRate, sampleFrames
+
+
+CHUNK_SIZE = 1 << 16
+# ffmpeg probes the container itself, the suffix only needs to be right for the common types.
+VIDEO_SUFFIXES = MappingProxyType({
+    "video/x-msvideo": ".avi",
+    "video/mp4": ".mp4",
+    "video/mpeg": ".mpeg",
+    "video/ogg": ".ogv",
+    "video/mp2t": ".ts",
+    "video/webm": ".webm",
+    "video/x-matroska": ".mkv",
+    "video/quicktime": ".mov"
+})
+# Videos need a seekable file for keyframe seeking, keep it in memory backed tmpfs when there's one and it has room.
+TMP_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+# Only use tmpfs if it has this many times the video's size free, so concurrent requests don't fill it.
+TMP_HEADROOM = 2
+CATEGORIES = ["drawings", "hentai", "neutral", "porn", "sexy"]
+USER_AGENT = "Mozilla/5.0 (Windows NT 5.0; Windows NT 5.1; Windows NT 6.0; Windows NT 6.1; Linux; es-VE; rv:52.9.0) Gecko/20100101 Firefox/52.9.0"
+
+
+class NSFWClassifier:
+    """
+    Classifies image/video urls. Meant to be a drop in replacement for fastnsfw's Classifier.
+
+    Parameters
+    ----------
+    `model` : str
+        Path to the model. Paths ending with .onnx are run with ONNX Runtime, anything else is loaded as a keras model.
+    `logging` : Logger
+        Logger to use, a new one is created if not provided.
+
+    -- Non required --
+    `imgSize` : Tuple[int, int]
+        Size the frames are resized to before being classified.
+    `frameUniqueness` : float
+        Minimum hash difference for a frame to be considered unique.
+    `sampleRate` : int
+        Milliseconds between each sampled video frame.
+    `batchSize` : int
+        Amount of frames passed to the model per call. Sweep 8/16/32 on the target machine if you change this.
+    `intraOpThreads` : int
+        Threads the backend uses inside a single op, defaults to the amount of cpus.
+    `interOpThreads` : int
+        Threads the backend uses to run independent ops concurrently.
+    `providers` : List[str]
+        ONNX Runtime execution providers in order of preference, the ones that aren't available are skipped.
+    `cache` : Collection
+        pymongo or pymongo-like collection to store classifications in. Caching is disabled if not provided.
+    `memoEntries` : int
+        Amount of cache lookups kept in memory in front of the collection.
+    `batchWaitMs` : float
+        How long frames wait for frames from other requests to share a model run with.
+    """
+
+    def __init__(self, model: str, logging: Logger = None, **kwargs) -> None:
+        self.logging = logging if logging else Logger()
+        self.intraOpThreads = kwargs.get("intraOpThreads", os.cpu_count())
+        self.interOpThreads = kwargs.get("interOpThreads", 2)
+        self.providers = kwargs.get("providers", ["CUDAExecutionProvider", "CPUExecutionProvider"])
+
+        self.model = None
+        self.session = None
+
+        if model.endswith(".onnx"):
+            self.loadOnnx(model)
+        else:
+            self.loadKeras(model)
+
+        self.frameUniqueness = kwargs.get("frameUniqueness", 5)
+        self.imgSize = kwargs.get("imgSize", (224, 224))
+        self.sampleRate = kwargs.get("sampleRate", 1000)
+        self.batchSize = kwargs.get("batchSize", 16)
+        self.cache = kwargs.get("cache")
+        self.memo = BoundedCache(kwargs.get("memoEntries", 4096))
+
+        self.warmup()
+        self.scheduler = BatchScheduler(
+            self.runModel, self.batchSize, kwargs.get("batchWaitMs", 8))
+
+    def loadKeras(self, path: str) -> None:
+        # Imported here as tensorflow is slow to import and heavy on memory, ONNX models don't need it.
+        import tensorflow as tf
+        from nsfw_detector import predict
+
+        # Has to happen before tensorflow initializes its runtime, which load_model does.
+        try:
+            tf.config.threading.set_intra_op_parallelism_threads(self.intraOpThreads)
+            tf.config.threading.set_inter_op_parallelism_threads(self.interOpThreads)
+        except RuntimeError as e:
+            self.logging.warning(f"Couldn't configure tensorflow threads: {e}")
+
+        self.model = predict.load_model(path)
+
+    def loadOnnx(self, path: str) -> None:
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = self.intraOpThreads
+        options.inter_op_num_threads = self.interOpThreads
+        options.add_session_config_entry("session.intra_op.allow_spinning", "1")
+
+        available = ort.get_available_providers()
+        self.session = ort.InferenceSession(
+            path, sess_options=options, providers=[x for x in self.providers if x in available])
+        self.inputName = self.session.get_inputs()[0].name
+        self.outputName = self.session.get_outputs()[0].name
+        self.onGpu = self.session.get_providers()[0] == "CUDAExecutionProvider"
+
+        self.logging.debug(f"Running {path} on {self.session.get_providers()}")
+
+    def runModel(self, batch: np.ndarray) -> np.ndarray:
+        """Run a single batch through whichever backend the model was loaded with."""
+
+        if self.session is None:
+            return np.asarray(self.model.predict_on_batch(batch))
+
+        if not self.onGpu:
+            return self.session.run(None, {self.inputName: batch})[0]
+
+        # Upload the batch once and keep the output on the device until it's copied back.
+        binding = self.session.io_binding()
+        binding.bind_ortvalue_input(
+            self.inputName, ort.OrtValue.ortvalue_from_numpy(batch, "cuda", 0))
+        binding.bind_output(self.outputName, "cuda", 0)
+
+        self.session.run_with_iobinding(binding)
+        return binding.copy_outputs_to_cpu()[0]
+
+    def warmup(self) -> None:
+        """
+        Run a dummy batch through the model so the backend does its first run setup (keras building its predict
+        function, ONNX Runtime allocating its buffers) here instead of on the first request. This runs before the
+        scheduler starts, afterwards the model is only ever run from self.scheduler's thread, go through it instead of
+        calling runModel directly.
+        """
+
+        start = time.time()
+        self.runModel(
+            np.zeros((self.batchSize, self.imgSize[1], self.imgSize[0], 3), dtype=np.float32))
+
+        end = round((time.time() - start) * 1000, 2)
+        self.logging.debug(f"Warming up the model took {end}ms.")
+
+    def download(self, url: str) -> requests.Response:
+        """Request url with a streamed body, raises InternalRequestError if it fails."""
+
+        try:
+            r = requests.get(url, headers={"User-Agent": USER_AGENT}, stream=True)
+            r.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            raise InternalRequestError(e)
+
+        return r
+
+    def readContent(self, r: requests.Response, dest: BinaryIO = None) -> Tuple[str, Optional[bytes]]:
+        """
+        Read the body of r, hashing it as it streams in. Returns the hash and the body, unless dest is provided in
+        which case the body is written into dest instead of being kept in memory.
+        """
+
+        start = time.time()
+        hasher = xxhash.xxh3_64()
+        chunks = []
+
+        try:
+            for chunk in r.iter_content(CHUNK_SIZE):
+                hasher.update(chunk)
+                if dest:
+                    dest.write(chunk)
+                else:
+                    chunks.append(chunk)
+        except requests.exceptions.RequestException as e:
+            raise InternalRequestError(e)
+
+        end = round((time.time() - start) * 1000, 2)
+        self.logging.debug(f"Getting content from url took {end}ms")
+
+        return hasher.hexdigest(), None if dest else b"".join(chunks)
+
+    def preprocess(self, frames: List[Image.Image]) -> np.ndarray:
+        """Resize and normalize frames into a single (N, height, width, 3) float32 array."""
+
+        batch = np.empty(
+            (len(frames), self.imgSize[1], self.imgSize[0], 3), dtype=np.float32)
+
+        for i, frame in enumerate(frames):
+            # Resizing before converting to floats keeps the full resolution frame as uint8.
+            batch[i] = cv2.resize(np.asarray(frame.convert("RGB")), self.imgSize)
+
+        batch /= 255
+        return batch
+
+    def predict(self, batch: np.ndarray) -> List[dict]:
+        """Run the model over batch in chunks of self.batchSize, sharing model runs with other requests."""
+
+        start = time.time()
+        results = []
+        for i in range(0, len(batch), self.batchSize):
+            preds = self.scheduler.submit(batch[i:i + self.batchSize])
+            results.extend({c: float(p) for c, p in zip(CATEGORIES, pred)} for pred in preds)
+
+        end = round((time.time() - start) * 1000, 2)
+        self.logging.debug(f"Classifying {len(batch)} frames took {end}ms.")
+        return results
+
+    def classifyFrames(self, frames: Iterable[Image.Image]) -> List[dict]:
+        """Classify frames batchSize at a time as they are produced by the iterable."""
+
+        results = []
+        chunk = []
+        for frame in frames:
+            chunk.append(frame)
+            if len(chunk) == self.batchSize:
+                results.extend(self.predict(self.preprocess(chunk)))
+                chunk = []
+
+        if chunk:
+            results.extend(self.predict(self.preprocess(chunk)))
+        return results
+
+    def gifFrames(self, content: bytes) -> List[Image.Image]:
+        """Extract the frames of a gif, skipping the ones within self.frameUniqueness of an already kept frame."""
+
+        start = time.time()
+        frames = []
+        hashes = []
+
+        with Image.open(BytesIO(content)) as img:
+            for frame in ImageSequence.Iterator(img):
+                # convert makes a copy, the iterator reuses a single image that gets closed with the file.
+                frame = frame.convert("RGB")
+                hashed = imagehash.average_hash(frame)
+
+                if all((x - hashed) >= self.frameUniqueness for x in hashes):
+                    frames.append(frame)
+                    hashes.append(hashed)
+
+            total = img.n_frames
+
+        end = round((time.time() - start) * 1000, 2)
+        self.logging.debug(f"Extracted {len(frames)}/{total} unique frames from a GIF in {end}ms.")
+        return frames
+
+    def pipedFrames(self, path: str) -> Iterable[Image.Image]:
+        """Decode the jpegs piped out of ffmpeg for the video at path."""
+
+        for jpeg in extractFrames(path, self.sampleRate, self.imgSize):
+            yield Image.open(BytesIO(jpeg))
+
+    def classifyVideo(self, path: str) -> List[dict]:
+        """Classify the sampled frames of the video at path."""
+
+        try:
+            return self.classifyFrames(sampleFrames(path, self.sampleRate))
+        except VariableFrameRate as e:
+            self.logging.debug(f"Variable frame rate video ({e}), decoding through ffmpeg instead.")
+
+        return self.classifyFrames(self.pipedFrames(path))
+
+    def framesData(self, results: List[dict]) -> dict:
+        """Key the frame results by their index, as a string so they can be stored as is in mongodb."""
+        return {"frames": {str(i): c for i, c in enumerate(results)}}
+
+    def lookup(self, query: dict) -> Optional[dict]:
+        """Returns a previously stored classification matching query, None if there's none or caching is disabled."""
+
+        if self.cache is None:
+            return None
+
+        key = tuple(query.items())
+        data = self.memo.get(key)
+        if data:
+            return data
+
+        document = self.cache.find_one(query)
+        if document:
+            data = {"contentType": document["contentType"], "data": document["data"]}
+            self.memo.set(key, data)
+            return data
+        return None
+
+    def store(self, contentHash: str, data: dict, perceptualHash: str = None) -> None:
+        """Store a classification under its content hash (and perceptual hash for still images)."""
+
+        if self.cache is None:
+            return
+
+        document = {
+            "hash": contentHash,
+            "contentType": data["contentType"],
+            "data": data["data"],
+            "created": datetime.datetime.now()}
+
+        if perceptualHash:
+            document["perceptualHash"] = perceptualHash
+
+        self.cache.insert_one(document)
+
+        value = {"contentType": data["contentType"], "data": data["data"]}
+        self.memo.set((("hash", contentHash),), value)
+        if perceptualHash:
+            self.memo.set((("perceptualHash", perceptualHash),), value)
+
+    def classify(self, url: str) -> dict:
+        """
+        Classify a image/video url. Results are looked up by an xxh3 hash of the content first, and for still
+        images by their perceptual hash afterwards, before anything gets classified.
+
+        Returns
+        -------
+        {
+            "contentType": str,
+            "data": {
+                if video or gif:
+                    "frames": {
+                        str(frame_number): {
+                            "sexy": float,
+                            "neutral": float,
+                            "porn": float,
+                            "hentai": float,
+                            "drawings": float
+                        },
+                        ...
+                    }
+                else:
+                    "sexy": float,
+                    "neutral": float,
+                    "porn": float,
+                    "hentai": float,
+                    "drawings": float
+            }
+        }
+
+        Raises
+        ------
+        `InternalRequestError` :
+            When there's an error getting the content from the url.
+        `UnknownContentType` :
+            When the content type is not supported or unknown, or when a video can't be decoded.
+        """
+
+        with self.download(url) as r:
+            contentType = r.headers["Content-Type"].lower().strip()
+
+            if contentType.startswith("video/"):
+                return self.classifyVideoResponse(r, contentType)
+            if contentType.startswith("image/"):
+                return self.classifyImageResponse(r, contentType)
+
+        raise UnknownContentType(contentType)
+
+    def tempDir(self, r: requests.Response) -> Optional[str]:
+        """Returns TMP_DIR if the response's Content-Length fits in it, None (the default temp dir) otherwise."""
+
+        if TMP_DIR is None:
+            return None
+
+        try:
+            size = int(r.headers["Content-Length"])
+            stats = os.statvfs(TMP_DIR)
+        except (KeyError, ValueError, OSError):
+            return None
+
+        if size * TMP_HEADROOM <= stats.f_bavail * stats.f_frsize:
+            return TMP_DIR
+        return None
+
+    def classifyVideoResponse(self, r: requests.Response, contentType: str) -> dict:
+        """Stream a video response into a temporary file (on tmpfs if it has room) and classify it."""
+
+        tmpDir = self.tempDir(r)
+        try:
+            return self.classifyVideoFile(r, contentType, tmpDir)
+        except OSError as e:
+            # Concurrent requests can still fill tmpfs after the check, the body is gone by then so fetch it again.
+            if tmpDir is None or e.errno != errno.ENOSPC:
+                raise
+
+            self.logging.warning(f"{tmpDir} ran out of space, downloading {r.url} again into the default temp dir")
+            with self.download(r.url) as retry:
+                return self.classifyVideoFile(retry, contentType, None)
+
+    def classifyVideoFile(self, r: requests.Response, contentType: str, tmpDir: Optional[str]) -> dict:
+        suffix = VIDEO_SUFFIXES.get(contentType, ".mp4")
+        tmp = tempfile.NamedTemporaryFile(delete=False, suffix=suffix, dir=tmpDir)
+        try:
+            with tmp:
+                contentHash, _ = self.readContent(r, tmp)
+
+            cached = self.lookup({"hash": contentHash})
+            if cached:
+                self.logging.debug(f"Cache hit for {contentHash}")
+                return cached
+
+            try:
+                data = {"contentType": contentType, "data": self.framesData(self.classifyVideo(tmp.name))}
+            except (FFmpegError, av.error.FFmpegError) as e:
+                self.logging.error(f"ffmpeg failed to decode {r.url}: {e}")
+                raise UnknownContentType(contentType)
+        finally:
+            os.unlink(tmp.name)
+
+        self.store(contentHash, data)
+        return data
+
+    def classifyImageResponse(self, r: requests.Response, contentType: str) -> dict:
+        """Classify an image or gif response in memory."""
+
+        contentHash, content = self.readContent(r)
+
+        cached = self.lookup({"hash": contentHash})
+        if cached:
+            self.logging.debug(f"Cache hit for {contentHash}")
+            return cached
+
+        data = {"contentType": contentType}
+        perceptualHash = None
+
+        if contentType == "image/gif":
+            data["data"] = self.framesData(self.classifyFrames(self.gifFrames(content)))
+
+        else:
+            with Image.open(BytesIO(content)) as img:
+                # Only pay for the perceptual hash once the exact content hash missed.
+                perceptualHash = str(imagehash.phash(img))
+                cached = self.lookup({"perceptualHash": perceptualHash})
+
+                if cached:
+                    # The near duplicate can be a different format, only its classification carries over.
+                    self.logging.debug(f"Perceptual cache hit for {contentHash} ({perceptualHash})")
+                    data["data"] = cached["data"]
+                else:
+                    data["data"] = self.predict(self.preprocess([img]))[0]
+
+        self.store(contentHash, data, perceptualHash)
+        return data
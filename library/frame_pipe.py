@@ -0,0 +1,101 @@
+"""Extract sampled video frames with a single ffmpeg process piping jpegs through stdout."""
+
+import subprocess
+import tempfile
+import threading
+from typing import Iterator, Tuple
+
+
+SOI = b"\xff\xd8"
+EOI = b"\xff\xd9"
+READ_SIZE = 1 << 16
+TIMEOUT = 120
+
+
+class FFmpegError(Exception):
+    """
+    Raised when ffmpeg exits with a non zero status or takes longer than its timeout.
+    """
+
+
+def extractFrames(path: str, stepMs: int, size: Tuple[int, int], timeout: float = TIMEOUT) -> Iterator[bytes]:
+    """
+    Yield one jpeg encoded frame every stepMs milliseconds of the video at path, scaled to size.
+
+    Parameters
+    ----------
+    `path` : str
+        Path to the video file.
+    `stepMs` : int
+        Milliseconds between each sampled frame.
+    `size` : Tuple[int, int]
+        Width and height the frames are scaled to by ffmpeg.
+    `timeout` : float
+        Seconds after which ffmpeg is killed, counted from when it's started.
+
+    Raises
+    ------
+    `FFmpegError` :
+        When ffmpeg fails to decode the video or times out.
+    """
+
+    cmd = [
+        "ffmpeg", "-v", "error", "-nostdin",
+        "-i", path,
+        "-vf", f"fps=1000/{stepMs},scale={size[0]}:{size[1]}",
+        "-f", "image2pipe", "-vcodec", "mjpeg", "-q:v", "2",
+        "pipe:1"
+    ]
+
+    # stderr goes to a file, a pipe nobody reads until stdout is done fills up on damaged videos and deadlocks ffmpeg.
+    stderr = tempfile.TemporaryFile()
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr)
+
+    timedOut = threading.Event()
+
+    def kill():
+        timedOut.set()
+        process.kill()
+
+    timer = threading.Timer(timeout, kill)
+    timer.daemon = True
+    timer.start()
+
+    try:
+        buffer = bytearray()
+        while True:
+            # read1 returns whatever is available instead of waiting for READ_SIZE bytes, so frames come out as soon
+            # as ffmpeg writes them.
+            chunk = process.stdout.read1(READ_SIZE)
+            if not chunk:
+                break
+            buffer.extend(chunk)
+
+            # ffmpeg's mjpeg encoder doesn't embed thumbnails so the first EOI after a SOI always ends the frame.
+            while True:
+                start = buffer.find(SOI)
+                if start == -1:
+                    del buffer[:-1]
+                    break
+
+                end = buffer.find(EOI, start + 2)
+                if end == -1:
+                    del buffer[:start]
+                    break
+
+                yield bytes(buffer[start:end + 2])
+                del buffer[:end + 2]
+
+        if process.wait() != 0:
+            if timedOut.is_set():
+                raise FFmpegError(f"ffmpeg took longer than {timeout}s")
+
+            stderr.seek(0)
+            raise FFmpegError(stderr.read().decode(errors="replace").strip())
+    finally:
+        timer.cancel()
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        stderr.close()
@@ -1,6 +1,11 @@
-from schema import Schema, And, Use, Optional
+import fastjsonschema
 
-NSFW_DETECTION_CLASSIFY = Schema({
-    "url": And(Use(str)),
-    Optional("ratelimitKey"): And(Use(str))
+NSFW_DETECTION_CLASSIFY = fastjsonschema.compile({
+    "type": "object",
+    "properties": {
+        "url": {"type": "string"},
+        "ratelimitKey": {"type": ["string", "number"]}
+    },
+    "required": ["url"],
+    "additionalProperties": False
 })
@@ -1,6 +1,8 @@
 import datetime
 import string
+import threading
 import time
+from array import array
 from functools import wraps
 from typing import Any, Callable, Union
 
@@ -8,7 +10,6 @@ from flask import Flask, request
 from fluxhelper import generateId
 from fluxhelper.flask import makeResponse
 from pymongo.database import Database
-from schema import Schema
 from library.utilities import schemaCheck
 
 
@@ -45,17 +46,19 @@ class APISecurity:
         self.keyLength = kwargs.get("keyLength", 50)
 
         self.keys = []
+        self.keySet = set()
         self.lastRefresh = None
+        self.refreshLock = threading.Lock()
 
     def patch(self) -> None:
         """Patch flask's before_request. Must be called."""
         @self.app.before_request
-        async def beforeRequest():
+        def beforeRequest():
             data = request.json
             if data:
                 key = data.pop("__key__", None)
                 if key:
-                    if await self.validateKey(key):
+                    if self.validateKey(key):
                         return
 
             return makeResponse(status=401, msg="unauthorized")
@@ -76,21 +79,25 @@ class APISecurity:
         self.db.keys.update_one({"key": key}, {"$set": {"active": True}})
         return key
 
-    async def refreshKeys(self) -> None:
-        if self.lastRefresh is not None:
-            if not((time.time() - self.lastRefresh) >= self.refreshRate):
-                return
+    def keysExpired(self) -> bool:
+        return self.lastRefresh is None or (time.time() - self.lastRefresh) >= self.refreshRate
+
+    def refreshKeys(self) -> None:
+        if not self.keysExpired():
+            return
 
-        self.keys = list(self.db.keys.find({"active": True}))
-        self.lastRefresh = time.time()
+        # Only one thread queries the database, the rest wait for it and then see fresh keys on the re-check.
+        with self.refreshLock:
+            if not self.keysExpired():
+                return
 
-    async def validateKey(self, key: str) -> bool:
-        await self.refreshKeys()
-        queried = [x for x in self.keys if x["key"] == key]
+            self.keys = list(self.db.keys.find({"active": True}))
+            self.keySet = {x["key"] for x in self.keys}
+            self.lastRefresh = time.time()
 
-        if queried:
-            return True
-        return False
+    def validateKey(self, key: str) -> bool:
+        self.refreshKeys()
+        return key in self.keySet
 
 
 class RateLimiter:
@@ -101,15 +108,25 @@ class RateLimiter:
     ----------
     `key` : Union[Callable, str]
         Key to use, if provided a string, it would treat that string as if it's a key inside request.json.
+    `ttl` : float
+        Seconds after which a key's last request no longer matters and its slot can be reclaimed.
+    `compactSize` : int
+        Amount of slots to reach before reclaiming the slots of expired keys.
     """
 
-    def __init__(self, key: Union[Callable, str] = None) -> None:
+    def __init__(self, key: Union[Callable, str] = None, ttl: float = 60.0, compactSize: int = 65536) -> None:
 
         self.key = key
         if not self.key:
             self.key = self.getRemoteAddr
 
-        self.requests = {}
+        self.ttl = ttl
+        self.compactSize = compactSize
+
+        # Last request times are kept unboxed in a single array, slots maps each key to its index in it.
+        self.slots = {}
+        self.times = array("d")
+        self.lock = threading.Lock()
 
     def getRemoteAddr(self) -> str:
         return request.remote_addr
@@ -120,12 +137,46 @@ class RateLimiter:
             return data[self.key]
         return self.key()
 
+    def compact(self, now: float) -> None:
+        """Drop the keys whose last request is older than self.ttl and pack the remaining times together."""
+
+        slots = {}
+        times = array("d")
+        for key, index in self.slots.items():
+            if now - self.times[index] < self.ttl:
+                slots[key] = len(times)
+                times.append(self.times[index])
+
+        self.slots = slots
+        self.times = times
+
+        # Avoid compacting on every new key when most keys are still active.
+        self.compactSize = max(self.compactSize, len(self.times) * 2)
+
+    def hit(self, key: Any) -> float:
+        """Record a request from key and return the time of its previous one, 0.0 if there's none."""
+
+        now = time.time()
+        with self.lock:
+            index = self.slots.get(key)
+            if index is None:
+                if len(self.times) >= self.compactSize:
+                    self.compact(now)
+
+                self.slots[key] = len(self.times)
+                self.times.append(now)
+                return 0.0
+
+            prevRequest = self.times[index]
+            self.times[index] = now
+            return prevRequest
+
     def limit(self, count: int, returnFunction: callable = None, key: Union[Callable, str] = None) -> None:
         """Rate limit a route using seconds, e.g., 5 per second, 2 per second."""
 
         def decorator(func):
             @wraps(func)
-            async def wrapper(*args, **kwargs):
+            def wrapper(*args, **kwargs):
 
                 key_ = None
 
@@ -141,8 +192,7 @@ class RateLimiter:
                 except (KeyError, IndexError, ValueError, AttributeError):
                     key_ = self.getKey()
 
-                prevRequest = self.requests.get(key_)
-                self.requests[key_] = time.time()
+                prevRequest = self.hit(key_)
 
                 if prevRequest:
                     if (time.time() - prevRequest) < (1 / count):
@@ -150,14 +200,14 @@ class RateLimiter:
                             return returnFunction()
                         return makeResponse(status=429, msg="rate limit in place")
 
-                return await func(*args, **kwargs)
+                return func(*args, **kwargs)
             return wrapper
         return decorator
 
 
 class RouteValidator:
     """
-    Validates the json content of a request using the schema library.
+    Validates the json content of a request using validators compiled by fastjsonschema.
 
     Parameters
     ----------
@@ -171,15 +221,15 @@ class RouteValidator:
     def defaultHandler(self) -> None:
         return makeResponse(status=400, msg="incorrectly structured data")
     
-    def validate(self, schema: Schema) -> None:
+    def validate(self, schema: Callable) -> None:
         """Validate a route's json data."""
 
         def decorator(func):
             @wraps(func)
-            async def wrapper(*args, **kwargs):
+            def wrapper(*args, **kwargs):
                 data = request.json
                 if schemaCheck(schema, data):
-                    return await func(*args, **kwargs)
+                    return func(*args, **kwargs)
 
                 return self.handler()
             return wrapper
@@ -0,0 +1,28 @@
+"""orjson backed json handling for flask."""
+
+from typing import Any
+
+import orjson
+from flask import Flask
+from flask.json.provider import JSONProvider
+
+
+class ORJSONProvider(JSONProvider):
+    """
+    JSON provider that parses request bodies and serializes responses with orjson instead of the json module.
+    Keys are left in insertion order, sorting would order string keys like frame indexes as text.
+    """
+
+    option = orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, obj: Any, **kwargs) -> str:
+        return orjson.dumps(obj, option=self.option).decode()
+
+    def loads(self, s: Any, **kwargs) -> Any:
+        return orjson.loads(s)
+
+
+class ORJSONFlask(Flask):
+    """Flask app using ORJSONProvider for request.json and jsonify."""
+
+    json_provider_class = ORJSONProvider
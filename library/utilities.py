@@ -1,6 +1,31 @@
 import sys
+from typing import Any, Callable, Hashable
 
-from schema import Schema, SchemaError
+from fastjsonschema import JsonSchemaException
+
+
+class BoundedCache:
+    """
+    In-process cache that gets wiped wholesale once it reaches maxEntries, keeping memory bounded without the
+    bookkeeping of an LRU.
+
+    Parameters
+    ----------
+    `maxEntries` : int
+        Amount of entries to hold before clearing.
+    """
+
+    def __init__(self, maxEntries: int = 4096) -> None:
+        self.maxEntries = maxEntries
+        self.entries = {}
+
+    def get(self, key: Hashable) -> Any:
+        return self.entries.get(key)
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if len(self.entries) >= self.maxEntries:
+            self.entries.clear()
+        self.entries[key] = value
 
 
 def inCloud() -> bool:
@@ -11,11 +36,11 @@ def inCloud() -> bool:
     return False
 
 
-def schemaCheck(schema: Schema, dict_: dict) -> bool:
-    """Returns True if the schema of dict_ matches that of schema."""
+def schemaCheck(schema: Callable, dict_: dict) -> bool:
+    """Returns True if dict_ passes schema, a validator compiled by fastjsonschema."""
 
     try:
-        schema.validate(dict_)
+        schema(dict_)
         return True
-    except SchemaError:
+    except JsonSchemaException:
         return False
@@ -0,0 +1,134 @@
+"""Sample video frames at a fixed interval using PyAV, seeking to keyframes instead of decoding every frame."""
+
+import itertools
+from typing import Iterator
+
+import av
+from PIL import Image
+
+
+# Tolerated difference between a stream's average and base frame rate before it's treated as variable.
+VFR_TOLERANCE = 0.01
+
+
+class VariableFrameRate(Exception):
+    """
+    Raised when a video stream has a variable frame rate, keyframe seeking is unreliable on those.
+    """
+
+
+def isVariableFrameRate(stream: av.video.stream.VideoStream) -> bool:
+    """Returns True if the stream's average frame rate doesn't match its base frame rate."""
+
+    average, base = stream.average_rate, stream.base_rate
+    if not average or not base:
+        return True
+    return abs(average - base) / base > VFR_TOLERANCE
+
+
+def seekBefore(container: av.container.InputContainer, stream: av.video.stream.VideoStream, target: float,
+               gop: float, start: float) -> Iterator[av.VideoFrame]:
+    """
+    Seek to the keyframe at or before target and return the decoded frames from there.
+
+    Seeking goes by dts, so on streams with B-frames it can land on a keyframe presented after target. When it does,
+    seek again one keyframe interval further back until the first frame isn't past target.
+    """
+
+    offset = target
+    while True:
+        container.seek(int(offset / stream.time_base), any_frame=False, backward=True, stream=stream)
+        frames = container.decode(stream)
+
+        first = next((frame for frame in frames if frame.time is not None), None)
+        if first is None:
+            return frames
+        if first.time <= target or offset <= start:
+            return itertools.chain([first], frames)
+
+        offset = max(offset - gop, start)
+
+
+def sampleFrames(path: str, stepMs: int) -> Iterator[Image.Image]:
+    """
+    Yield the frame closest to every stepMs milliseconds of the video at path.
+
+    The decoder only seeks once the distance to the next target is larger than the keyframe interval seen so
+    far, as seeking to a keyframe we've already decoded past would redo work instead of skipping it.
+
+    Parameters
+    ----------
+    `path` : str
+        Path to the video file.
+    `stepMs` : int
+        Milliseconds between each sampled frame.
+
+    Raises
+    ------
+    `VariableFrameRate` :
+        When the video has a variable frame rate.
+    `av.error.FFmpegError` :
+        When the video can't be opened or decoded, or has no video stream.
+    """
+
+    with av.open(path) as container:
+        if not container.streams.video:
+            raise av.error.FFmpegError(0, f"{path} has no video stream")
+
+        stream = container.streams.video[0]
+        if isVariableFrameRate(stream):
+            raise VariableFrameRate(f"{stream.average_rate} != {stream.base_rate}")
+
+        stream.thread_type = "AUTO"
+
+        if stream.duration:
+            duration = float(stream.duration * stream.time_base)
+        elif container.duration:
+            duration = container.duration / av.time_base
+        else:
+            duration = float("inf")
+
+        # Frame times and seek offsets are absolute pts, which don't start at 0 in formats like mpeg-ts.
+        start = float(stream.start_time * stream.time_base) if stream.start_time else 0.0
+        end = start + duration
+
+        step = stepMs / 1000
+        target = start
+        frames = container.decode(stream)
+
+        previous = None
+        lastKeyframe = None
+        gop = None
+
+        while target < end:
+            if gop is not None and previous is not None and target - previous.time > gop:
+                frames = seekBefore(container, stream, target, gop, start)
+                previous = None
+                lastKeyframe = None
+
+            chosen = None
+            for frame in frames:
+                if frame.time is None:
+                    continue
+
+                if frame.key_frame:
+                    if lastKeyframe is not None and frame.time > lastKeyframe:
+                        gop = frame.time - lastKeyframe
+                    lastKeyframe = frame.time
+
+                if frame.time >= target:
+                    if previous is None or frame.time - target <= target - previous.time:
+                        chosen = frame
+                    else:
+                        chosen = previous
+
+                    previous = frame
+                    break
+
+                previous = frame
+
+            if chosen is None:
+                break
+
+            yield chosen.to_image()
+            target += step
@@ -0,0 +1,67 @@
+from fractions import Fraction
+
+import pytest
+
+av = pytest.importorskip("av")
+np = pytest.importorskip("numpy")
+
+from library.video_sampler import sampleFrames
+
+
+FPS = 10
+SECONDS = 10
+
+
+def makeClip(path: str, offset: int, bFrames: int = 0) -> None:
+    """Encode a SECONDS long mp4 at FPS whose first frame has a pts of offset frames."""
+
+    with av.open(path, "w") as output:
+        stream = output.add_stream("mpeg4", rate=FPS)
+        stream.width = stream.height = 64
+        stream.pix_fmt = "yuv420p"
+        stream.codec_context.gop_size = 5
+        stream.codec_context.max_b_frames = bFrames
+        stream.bit_rate = 10_000_000
+
+        for i in range(FPS * SECONDS):
+            # Encode the frame index into the brightness so the sampled frame can be identified.
+            frame = av.VideoFrame.from_ndarray(np.full((64, 64, 3), i * 2, dtype=np.uint8), format="rgb24")
+            frame.pts = offset + i
+            frame.time_base = Fraction(1, FPS)
+            for packet in stream.encode(frame):
+                output.mux(packet)
+
+        for packet in stream.encode():
+            output.mux(packet)
+
+
+def frameIndex(img) -> int:
+    return round(np.asarray(img.convert("L"), dtype=np.float64).mean() / 2)
+
+
+@pytest.mark.parametrize("offset,bFrames", [(0, 0), (14, 0), (0, 2), (14, 2)])
+def test_samples_one_frame_per_step(tmp_path, offset, bFrames):
+    path = str(tmp_path / "clip.mp4")
+    makeClip(path, offset, bFrames)
+
+    indexes = [frameIndex(img) for img in sampleFrames(path, 1000)]
+    expected = [i * FPS for i in range(SECONDS)]
+
+    # The colorspace round trip can shift the brightness by a frame, duplicated or skipped samples can't hide in that.
+    assert len(indexes) == len(expected)
+    assert all(abs(a - b) <= 1 for a, b in zip(indexes, expected)), indexes
+
+
+def test_no_video_stream_raises(tmp_path):
+    path = str(tmp_path / "audio.mp4")
+    with av.open(path, "w") as output:
+        stream = output.add_stream("aac", rate=44100)
+        frame = av.AudioFrame.from_ndarray(np.zeros((1, 1024), dtype=np.float32), format="fltp", layout="mono")
+        frame.sample_rate = 44100
+        for packet in stream.encode(frame):
+            output.mux(packet)
+        for packet in stream.encode():
+            output.mux(packet)
+
+    with pytest.raises(av.error.FFmpegError):
+        list(sampleFrames(path, 1000))